@@ -1,9 +1,20 @@
+import logging
 import secrets
-from nicegui import ui
+from nicegui import app, ui
 
+from app import ada_api
+from app.config import settings
 from app.server import configure_endpoints
 
 def start_web_server():
+    logging.basicConfig(level=settings().log_level.upper())
     configure_endpoints()
+    # Full-height column layout for the chat page, applied by the browser instead of per page load
+    ui.add_head_html(
+        "<style>.nicegui-content{height:100vh;display:flex;flex-direction:column;width:100%}</style>",
+        shared=True,
+    )
+    app.on_startup(ada_api.warm_up_session)
+    app.on_shutdown(ada_api.close_session)
     storage_secret = secrets.token_hex(16)
     ui.run(storage_secret=storage_secret)
@@ -1,25 +1,54 @@
 import json
-import os
 import aiohttp
-import dotenv
 
+from app import console
+from app.config import settings
 
-dotenv.load_dotenv()
-ADA_BASE_URL = os.environ["ADA_BASE_URL"]
-ADA_API_KEY = os.environ["ADA_API_KEY"]
-ADA_CHANNEL_ID = os.environ["ADA_CHANNEL_ID"]
+
+ADA_BASE_URL = settings().ada_base_url
+ADA_API_KEY = settings().ada_api_key
+ADA_CHANNEL_ID = settings().ada_channel_id
+
+_session: aiohttp.ClientSession | None = None
 
 
 def _colorize(status_code: int, text: str) -> str:
-    return (
-        (
-            "\033[92mSuccess Response: "
-            if status_code < 300
-            else "\033[91mError Response"
+    if status_code < 300:
+        return console.colorize(console.GREEN, "Success Response: " + text)
+    return console.colorize(console.RED, "Error Response: " + text)
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """Return the shared Ada API session, creating it on first use so connections are kept alive between calls"""
+    global _session
+
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=0, keepalive_timeout=75)
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            headers={"Authorization": f"Bearer {ADA_API_KEY}"},
         )
-        + text
-        + "\033[0m"
-    )
+    return _session
+
+
+async def close_session():
+    """Close the shared Ada API session"""
+    global _session
+
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+async def warm_up_session():
+    """Open a pooled connection to Ada ahead of the first API call so it doesn't pay the TLS handshake"""
+
+    session = await get_session()
+    try:
+        async with session.head(ADA_BASE_URL):
+            pass
+    except (aiohttp.ClientError, TimeoutError) as e:
+        print(console.colorize(console.YELLOW, f"Could not warm up connection to Ada: {e}"))
 
 
 async def send_user_message(
@@ -28,24 +57,23 @@ async def send_user_message(
     """Send an end user message to Ada"""
 
     print("Sending message...")
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            f"{ADA_BASE_URL}/api/v2/conversations/{conversation_id}/messages",
-            headers={"Authorization": f"Bearer {ADA_API_KEY}"},
-            json={
-                "author": {
-                    "role": "end_user",
-                    "display_name": display_name,
-                    "id": user_id,
-                    "avatar": avatar,
-                },
-                "content": {"type": "text", "body": text},
+    session = await get_session()
+    async with session.post(
+        f"{ADA_BASE_URL}/api/v2/conversations/{conversation_id}/messages",
+        json={
+            "author": {
+                "role": "end_user",
+                "display_name": display_name,
+                "id": user_id,
+                "avatar": avatar,
             },
-        ) as response:
-            body = await response.json()
-            print(_colorize(response.status, json.dumps(body)))
+            "content": {"type": "text", "body": text},
+        },
+    ) as response:
+        body = await response.text()
+        print(_colorize(response.status, body))
 
-            response.raise_for_status()
+        response.raise_for_status()
 
 
 async def start_new_conversation(user_id: str | None = None):
@@ -57,30 +85,29 @@ async def start_new_conversation(user_id: str | None = None):
         print("...with end_user_id....")
         request_body["end_user_id"] = user_id
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            f"{ADA_BASE_URL}/api/v2/conversations",
-            headers={"Authorization": f"Bearer {ADA_API_KEY}"},
-            json=request_body,
-        ) as response:
-            body = await response.json()
-            print(_colorize(response.status, json.dumps(body)))
+    session = await get_session()
+    async with session.post(
+        f"{ADA_BASE_URL}/api/v2/conversations",
+        json=request_body,
+    ) as response:
+        body = await response.text()
+        print(_colorize(response.status, body))
 
-            response.raise_for_status()
+        response.raise_for_status()
 
-            return body["end_user_id"], body["id"]
+        conversation = json.loads(body)
+        return conversation["end_user_id"], conversation["id"]
 
 
 async def end_conversation(conversation_id: str):
     """End a conversation with Ada"""
 
     print("Ending conversation...")
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            f"{ADA_BASE_URL}/api/v2/conversations/{conversation_id}/end",
-            headers={"Authorization": f"Bearer {ADA_API_KEY}"},
-        ) as response:
-            body = await response.json()
-            print(_colorize(response.status, json.dumps(body)))
-
-            response.raise_for_status()
+    session = await get_session()
+    async with session.post(
+        f"{ADA_BASE_URL}/api/v2/conversations/{conversation_id}/end",
+    ) as response:
+        body = await response.text()
+        print(_colorize(response.status, body))
+
+        response.raise_for_status()
@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+from functools import lru_cache
+import os
+
+import dotenv
+
+
+@dataclass(frozen=True)
+class Settings:
+    ada_base_url: str
+    ada_api_key: str
+    ada_channel_id: str
+    webhook_secret: str
+    log_level: str = "INFO"
+    batch_max_size: int = 32
+    batch_max_delay: float = 2.0
+    max_visible_messages: int = 500
+
+
+@lru_cache
+def settings() -> Settings:
+    """Load the .env file and snapshot the environment once per process"""
+
+    dotenv.load_dotenv()
+    return Settings(
+        ada_base_url=os.environ["ADA_BASE_URL"],
+        ada_api_key=os.environ["ADA_API_KEY"],
+        ada_channel_id=os.environ["ADA_CHANNEL_ID"],
+        webhook_secret=os.environ["WEBHOOK_SECRET"],
+        log_level=os.environ.get("LOG_LEVEL", "INFO"),
+        batch_max_size=int(os.environ.get("BATCH_MAX_SIZE", 32)),
+        batch_max_delay=float(os.environ.get("BATCH_MAX_DELAY", 2.0)),
+        max_visible_messages=int(os.environ.get("MAX_VISIBLE_MESSAGES", 500)),
+    )
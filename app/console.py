@@ -0,0 +1,18 @@
+import sys
+
+# Color codes are only noise when output goes to a log file or collector
+USE_COLOR = sys.stdout.isatty()
+
+GREEN = "\033[92m"
+RED = "\033[91m"
+YELLOW = "\033[93m"
+GRAY = "\033[90m"
+_RESET = "\033[0m"
+
+
+def colorize(color: str, text: str) -> str:
+    """Wrap text in an ANSI color code when printing to a terminal"""
+
+    if not USE_COLOR:
+        return text
+    return color + text + _RESET
@@ -1,9 +1,11 @@
 from nicegui import app
 
-from app.server.webhooks import router as webhooks_router
+from app.server.webhooks import router as webhooks_router, start_batch_worker, stop_batch_worker
 from app.webpage.index import router as index_router
 
 
 def configure_endpoints():
     app.include_router(webhooks_router)
     app.include_router(index_router)
+    app.on_startup(start_batch_worker)
+    app.on_shutdown(stop_batch_worker)
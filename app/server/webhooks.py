@@ -1,18 +1,27 @@
 import asyncio
+from collections import defaultdict
 from datetime import datetime
-import os
-from typing import Any, Literal, cast
-import dotenv
+import itertools
+import logging
+from typing import Annotated, Any, Literal
 from fastapi import HTTPException, Request
 from nicegui import APIRouter
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 import svix
 
-from app.data.messages import LinkContent, MessageContent, TextContent
+from app import console
+from app.config import settings
+from app.data.messages import LinkContent, TextContent
 from app.webpage.chat_ui import get_chat_ui
 
-dotenv.load_dotenv()
-WEBHOOK_SECRET = os.environ["WEBHOOK_SECRET"]
+WEBHOOK_SECRET = settings().webhook_secret
+BATCH_MAX_SIZE = settings().batch_max_size
+BATCH_MAX_DELAY = settings().batch_max_delay
+
+logger = logging.getLogger(__name__)
+
+# Alternatively you can follow these docs for manual signature verification: https://docs.svix.com/receiving/verifying-payloads/how-manual
+_webhook_verifier = svix.Webhook(WEBHOOK_SECRET)
 
 
 class PostMessageChannel(BaseModel):
@@ -71,88 +80,127 @@ class GenericEventRequest(BaseModel):
     data: dict[str, Any]
     timestamp: datetime
 
+
+WebhookEvent = Annotated[PostMessageRequest | EndConversationRequest, Field(discriminator="type")]
+
+_webhook_event_adapter = TypeAdapter(WebhookEvent)
+
 router = APIRouter(prefix="/webhooks", tags=["webhooks"])
 
-_global_msg_queue: list[PostMessageRequest] = []
+# Ordered by timestamp, then arrival order; only the batch worker consumes it
+_global_msg_queue: asyncio.PriorityQueue[tuple[datetime, int, PostMessageRequest]] = asyncio.PriorityQueue()
+_global_msg_counter = itertools.count()
 _global_batch_task: asyncio.Task | None = None
-_global_batch_lock = asyncio.Lock()
+_global_batch_event = asyncio.Event()
 
 
 @router.post("/message", status_code=204)
-async def post_message(msg: PostMessageRequest | EndConversationRequest | GenericEventRequest, request: Request):
-    print(f"\033[94mReceived webhook: {msg.model_dump_json()}\033[0m")
-
-    headers = request.headers
+async def post_message(request: Request):
+    headers = dict(request.headers)
     payload = await request.body()
 
     try:
-        # Alternatively you can follow these docs for manual signature verification: https://docs.svix.com/receiving/verifying-payloads/how-manual
-        webhook = svix.Webhook(WEBHOOK_SECRET)
-        webhook.verify(payload, cast(dict[str, str], headers))
+        _webhook_verifier.verify(payload, headers)
     except svix.WebhookVerificationError as e:
         raise HTTPException(status_code=400, detail="Bad Request") from e
 
+    # Only parse the body once the signature is known to be valid
+    msg = _parse_webhook_event(payload)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Received webhook: %s", msg.model_dump_json())
+
     if isinstance(msg, PostMessageRequest):
-        await push_message_to_queue(msg)
+        push_message_to_queue(msg)
     elif isinstance(msg, EndConversationRequest):
         chat_ui = get_chat_ui(msg.data.conversation_id)
         if chat_ui:
             chat_ui.disable_chat_inputs()
     else:
-        print(f"\033[90mWebhook failed to parse or received unsupported type: {msg.type}\033[0m")
+        print(console.colorize(console.GRAY, f"Webhook failed to parse or received unsupported type: {msg.type}"))
+
+
+def _parse_webhook_event(payload: bytes) -> PostMessageRequest | EndConversationRequest | GenericEventRequest:
+    """Dispatch on the event type, falling back to the generic model for unsupported or malformed events"""
+
+    try:
+        return _webhook_event_adapter.validate_json(payload)
+    except ValidationError:
+        pass
+
+    try:
+        return GenericEventRequest.model_validate_json(payload)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail="Unprocessable Entity") from e
 
 
-async def push_message_to_queue(msg: PostMessageRequest):
+def push_message_to_queue(msg: PostMessageRequest):
     """Batch messages in a queue to be processed after a delay to account for unordered messages"""
-    global _global_batch_lock
 
-    async with _global_batch_lock:
-        global _global_msg_queue, _global_batch_task
-        print("Pushing message to queue")
-        _global_msg_queue.append(msg)
+    print("Pushing message to queue")
+    _global_msg_queue.put_nowait((msg.timestamp, next(_global_msg_counter), msg))
+    _global_batch_event.set()
 
-        if _global_batch_task is not None:
-            print("Rescheduling batch task")
-            _global_batch_task.cancel()
-        else:
-            print("Scheduling new batch task")
 
+def start_batch_worker():
+    """Start the long-lived task that flushes the message queue"""
+    global _global_batch_task
+
+    if _global_batch_task is None:
         _global_batch_task = asyncio.create_task(batch_process_messages())
 
 
+def stop_batch_worker():
+    """Stop the message queue flushing task"""
+    global _global_batch_task
+
+    if _global_batch_task is not None:
+        _global_batch_task.cancel()
+        _global_batch_task = None
+
+
 async def batch_process_messages():
-    """Process all messages in the queue after a delay"""
-    global _global_batch_lock
+    """Process all messages in the queue once it is full or no new message has arrived for a while"""
 
-    await asyncio.sleep(2)
+    while True:
+        await _global_batch_event.wait()
+        _global_batch_event.clear()
 
-    async with _global_batch_lock:
-        global _global_msg_queue, _global_batch_task
-        messages = _global_msg_queue
-        _global_msg_queue = []
-        _global_batch_task = None
+        # Debounce: every new message restarts the delay, unless the batch is already full
+        while _global_msg_queue.qsize() < BATCH_MAX_SIZE:
+            try:
+                await asyncio.wait_for(_global_batch_event.wait(), timeout=BATCH_MAX_DELAY)
+            except TimeoutError:
+                break
+            _global_batch_event.clear()
 
-    print("Processing batched messages")
-    messages.sort(key=lambda m: m.timestamp)
-    for msg in messages:
-        push_message_to_chat(
-            msg.data.conversation_id,
-            msg.data.author.id,
-            msg.data.author.role,
-            msg.data.content,
-            msg.data.author.display_name,
-            msg.data.author.avatar,
-        )
+        messages = [_global_msg_queue.get_nowait()[-1] for _ in range(_global_msg_queue.qsize())]
+
+        print("Processing batched messages")
+        conversations: defaultdict[str, list[PostMessageRequest]] = defaultdict(list)
+        for msg in messages:
+            conversations[msg.data.conversation_id].append(msg)
+
+        for conversation_id, conversation_messages in conversations.items():
+            try:
+                push_messages_to_chat(conversation_id, conversation_messages)
+            except Exception:
+                logger.exception("Failed to push batched messages to conversation %s", conversation_id)
 
 
-def push_message_to_chat(conversation_id: str, user_id: str | None, role: str, content: MessageContent, display_name: str | None = None, avatar: str | None = None):
-    """Convert a message from Ada's webhook to one that is displayed in the chat UI"""
+def push_messages_to_chat(conversation_id: str, messages: list[PostMessageRequest]):
+    """Convert messages from Ada's webhook to ones that are displayed in the chat UI"""
 
     chat_ui = get_chat_ui(conversation_id)
-    if not chat_ui or user_id == chat_ui.active_end_user_id:
+    if not chat_ui:
         return
 
-    if content.type == "presence":
-        chat_ui.send_notification(content.body)
-    else:
-        chat_ui.add_message(user_id, role, content, display_name, avatar)
+    # Skip echoes of the end user's own messages, which are already displayed
+    messages = [m for m in messages if m.data.author.id not in chat_ui.active_end_user_ids]
+    for msg in messages:
+        author = msg.data.author
+        content = msg.data.content
+        if content.type == "presence":
+            chat_ui.send_notification(content.body)
+        else:
+            chat_ui.add_message(author.id, author.role, content, author.display_name, author.avatar)
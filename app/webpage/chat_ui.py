@@ -1,92 +1,129 @@
-from dataclasses import dataclass
+import asyncio
+from collections import deque
+from collections.abc import Callable
+from dataclasses import InitVar, dataclass, field
+import weakref
 
 from nicegui import ui
 
+from app.config import settings
 from app.data.messages import LinkContent, MessageContent, TextContent
 
+MAX_VISIBLE_MESSAGES = settings().max_visible_messages
 
-@dataclass
+# Coalesce UI updates arriving within one frame (at 60 fps) into a single refresh
+_REFRESH_DELAY = 0.016
+
+_DEFAULT_NAMES = {"ai_agent": "AI Agent", "human_agent": "Human Agent"}
+# Applied to the element's props directly, bypassing NiceGUI's props string parser
+_ROLE_PROPS = {"ai_agent": {"bg-color": "green-3"}, "human_agent": {"bg-color": "blue-3"}}
+
+
+@dataclass(slots=True)
 class Message:
     role: str
     content: MessageContent
     user_id: str | None = None
     name: str | None = None
     avatar: str | None = None
+    active_end_user_ids: InitVar[frozenset[str]] = frozenset()
+    display_name: str = field(init=False)
+    sent: bool = field(init=False)
+    props: dict[str, str] | None = field(init=False)
+
+    def __post_init__(self, active_end_user_ids: frozenset[str]) -> None:
+        default_name = _DEFAULT_NAMES.get(self.role, "End User")
+        self.display_name = f"{self.name or default_name} ({self.user_id or self.role})"
+        self.sent = self.user_id in active_end_user_ids
+        self.props = _ROLE_PROPS.get(self.role)
+
+
+def _no_bubble_text(content: MessageContent) -> list:
+    return []
 
-    @property
-    def display_name(self):
-        if self.role == "ai_agent":
-            default_name = "AI Agent"
-        elif self.role == "human_agent":
-            default_name = "Human Agent"
-        else:
-            default_name = "End User"
 
-        return f"{self.name or default_name} ({self.user_id or self.role})"
+def _attach_link_button(chat_msg: ui.chat_message, content: LinkContent):
+    link_text = content.link_text or "Click this link"
+    with chat_msg:
+        ui.button(link_text, on_click=lambda url=content.url: ui.navigate.to(url, new_tab=True))
 
 
-@dataclass
+# Per content type: the text shown in the bubble, and any extra elements to add to it
+_BUBBLE_TEXT: dict[type[MessageContent], Callable[[MessageContent], str | list]] = {
+    TextContent: lambda c: c.body,
+    LinkContent: _no_bubble_text,
+}
+_BUBBLE_EXTRA: dict[type[MessageContent], Callable[[ui.chat_message, MessageContent], None]] = {
+    LinkContent: _attach_link_button,
+}
+
+
+@dataclass(slots=True, weakref_slot=True)
 class ChatUI:
-    active_end_user_id: str
+    # End users chatting from this page; their messages are shown as sent
+    active_end_user_ids: frozenset[str]
     active_conversation_id: str
-    _text_input: ui.input | None = None
-    _end_button: ui.button | None = None
-    _reset_button: ui.button | None = None
+    text_input: ui.input = field(init=False)
+    end_button: ui.button = field(init=False)
+    reset_button: ui.button = field(init=False)
+    _messages: deque[Message] = field(init=False, default_factory=lambda: deque(maxlen=MAX_VISIBLE_MESSAGES))
+    _bubbles: deque[ui.chat_message] = field(init=False, default_factory=deque)
+    _unrendered_messages: list[Message] = field(init=False, default_factory=list)
+    _flush_scheduled: bool = field(init=False, default=False)
+    _chat_scroll: ui.scroll_area | None = field(init=False, default=None)
+    _message_column: ui.column | None = field(init=False, default=None)
 
     def __post_init__(self) -> None:
-        self._messages: list[Message] = []
         register_chat_ui(self)
 
-    @ui.refreshable
-    def notifier_element(self, text: str | None = None):
-        if text:
-            ui.notification(message=text, position="top", close_button=True, multi_line=True)
+    def message_list_element(self):
+        with ui.scroll_area().classes("flex-1") as self._chat_scroll:
+            self._message_column = ui.column().classes("w-full items-stretch")
+        self.rebuild_all()
 
+    def rebuild_all(self):
+        """Re-render every stored message, e.g. after loading history"""
 
-    @ui.refreshable
-    def message_list_element(self):
-        with ui.scroll_area().classes("flex-1") as chat_scroll:
-            with ui.column().classes("w-full items-stretch"):
-                for m in self._messages:
-                    bubble_text = m.content.body if isinstance(m.content, TextContent) else []
-
-                    chat_msg = ui.chat_message(text=bubble_text, sent=(m.user_id == self.active_end_user_id), name=m.display_name, avatar=m.avatar)
-                    if isinstance(m.content, LinkContent):
-                        with chat_msg:
-                            url = m.content.url
-                            ui.button(m.content.link_text or "Click this link", on_click=lambda: ui.navigate.to(url, new_tab=True))
-
-                    if m.role == "ai_agent":
-                        chat_msg.props("bg-color=green-3")
-                    elif m.role == "human_agent":
-                        chat_msg.props("bg-color=blue-3")
-
-        chat_scroll.scroll_to(percent=100)
-
-    @property
-    def text_input(self) -> ui.input:
-        if self._text_input is None:
-            self._text_input = ui.input(placeholder="Type a message...").props("outlined").classes("flex-grow")
-        return self._text_input
-
-    @property
-    def end_button(self) -> ui.button:
-        if self._end_button is None:
-            self._end_button = ui.button("End Chat", color="red", icon="exit_to_app")
-        return self._end_button
-
-    @property
-    def reset_button(self) -> ui.button:
-        if self._reset_button is None:
-            self._reset_button = ui.button("Reset", color="blue", icon="refresh")
-        return self._reset_button
+        if self._message_column is None or self._chat_scroll is None:
+            return
+
+        self._unrendered_messages = []
+        self._bubbles.clear()
+        self._message_column.clear()
+        with self._message_column:
+            for m in self._messages:
+                self._bubbles.append(self._render_bubble(m))
+        self._chat_scroll.scroll_to(percent=100)
+
+    def _append_bubble(self, m: Message):
+        if self._message_column is None:
+            return
+
+        with self._message_column:
+            self._bubbles.append(self._render_bubble(m))
+        # Keep the page in step with the bounded message history
+        while len(self._bubbles) > MAX_VISIBLE_MESSAGES:
+            self._bubbles.popleft().delete()
+
+    def _render_bubble(self, m: Message) -> ui.chat_message:
+        content_type = type(m.content)
+        bubble_text = _BUBBLE_TEXT.get(content_type, _no_bubble_text)(m.content)
+
+        chat_msg = ui.chat_message(text=bubble_text, sent=m.sent, name=m.display_name, avatar=m.avatar)
+        if extra := _BUBBLE_EXTRA.get(content_type):
+            extra(chat_msg, m.content)
+
+        if m.props:
+            chat_msg._props.update(m.props)
+
+        return chat_msg
 
     def chat_footer(self) -> ui.row:
         footer = ui.row().classes("h-12 w-full items-stretch")
         with footer:
-            self.text_input
-            self.end_button
-            self.reset_button
+            self.text_input = ui.input(placeholder="Type a message...").props("outlined").classes("flex-grow")
+            self.end_button = ui.button("End Chat", color="red", icon="exit_to_app")
+            self.reset_button = ui.button("Reset", color="blue", icon="refresh")
         return footer
 
     def disable_chat_inputs(self):
@@ -96,19 +133,44 @@ class ChatUI:
         self.end_button.disable()
 
     def add_message(self, user_id: str | None, role: str, content: MessageContent, name: str | None = None, avatar: str | None = None):
-        self._messages.append(Message(role, content, user_id, name, avatar))
-        self.message_list_element.refresh()
+        message = Message(role, content, user_id, name, avatar, self.active_end_user_ids)
+        self._messages.append(message)
+        self._unrendered_messages.append(message)
+        self._schedule_flush()
 
     def send_notification(self, text: str):
-        self.notifier_element.refresh(text)
+        if self._chat_scroll is None:
+            return
 
+        # Notifications remove themselves once dismissed, so they can go straight into the page layout
+        with self._chat_scroll.client.layout:
+            ui.notification(message=text, position="top", close_button=True, multi_line=True)
 
-_registered_chats: dict[str, ChatUI] = {}
+    def _schedule_flush(self):
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_later(_REFRESH_DELAY, self._flush)
 
+    def _flush(self):
+        """Apply all UI updates queued since the last flush in one go"""
+
+        self._flush_scheduled = False
+        if self._unrendered_messages:
+            # Anything beyond the visible limit would be evicted again straight away
+            messages = self._unrendered_messages[-MAX_VISIBLE_MESSAGES:]
+            self._unrendered_messages = []
+            for m in messages:
+                self._append_bubble(m)
+            # One scroll command per flush rather than one per bubble
+            if self._chat_scroll is not None:
+                self._chat_scroll.scroll_to(percent=100)
 
-def register_chat_ui(chat_ui: ChatUI):
-    global _registered_chats
 
+# Weak references, so a chat is dropped once its page (and the handlers referencing it) is gone
+_registered_chats: weakref.WeakValueDictionary[str, ChatUI] = weakref.WeakValueDictionary()
+
+
+def register_chat_ui(chat_ui: ChatUI):
     if chat_ui.active_conversation_id in _registered_chats:
         raise ValueError(f"Chat UI already registered for conversation {chat_ui.active_conversation_id}")
 
@@ -116,11 +178,9 @@ def register_chat_ui(chat_ui: ChatUI):
 
 
 def get_chat_ui(conversation_id: str) -> ChatUI | None:
-    global _registered_chats
     return _registered_chats.get(conversation_id)
 
 
 def unregister_chat_ui(conversation_id: str):
-    global _registered_chats
     if conversation_id in _registered_chats:
         del _registered_chats[conversation_id]
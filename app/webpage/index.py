@@ -1,5 +1,8 @@
+import asyncio
+from collections import deque
+from collections.abc import Awaitable, Callable
 import random
-from nicegui import ui, APIRouter, app
+from nicegui import background_tasks, ui, APIRouter, app
 
 from app import ada_api
 from app.data.messages import TextContent
@@ -8,41 +11,64 @@ from app.webpage.chat_ui import ChatUI
 
 router = APIRouter(prefix="", tags=["webpage"])
 
+_DEFAULT_AVATAR = "https://upload.wikimedia.org/wikipedia/commons/0/09/.hecko_-_Floaty_-_profile_picture.svg"
+
+_NAMES = tuple(
+    f"{first_name} {last_name}"
+    for first_name in ("John", "Jane", "Alice", "Bob", "Eve")
+    for last_name in ("Smith", "Johnson", "Williams", "Jones", "Brown")
+)
+
 
 def _generate_name() -> str:
-    first_name = random.choice(["John", "Jane", "Alice", "Bob", "Eve"])
-    last_name = random.choice(["Smith", "Johnson", "Williams", "Jones", "Brown"])
-    return f"{first_name} {last_name}"
+    return random.choice(_NAMES)
 
 
 @router.page("/")
 async def index():
+    async def _drain_outbox():
+        """Send queued requests to Ada one at a time, in the order they were made"""
+        while outbox:
+            request = outbox.popleft()
+            try:
+                await request()
+            except Exception as e:
+                chat_ui.send_notification(f"Request to Ada failed: {e}")
+
+    def _enqueue(request: Callable[[], Awaitable[None]]):
+        nonlocal sender
+        outbox.append(request)
+        # A single sender per page; it exits once the outbox is empty
+        if sender is None or sender.done():
+            sender = background_tasks.create(_drain_outbox(), name="send to Ada")
+
     async def _send():
         text_value = chat_ui.text_input.value
         chat_ui.add_message(user_id, "end_user", TextContent(body=text_value), display_name, avatar)
         chat_ui.text_input.value = ""
-        await ada_api.send_user_message(conversation_id, user_id, display_name, avatar, text_value)
+        _enqueue(lambda: ada_api.send_user_message(conversation_id, user_id, display_name, avatar, text_value))
 
     async def _end_chat():
         chat_ui.disable_chat_inputs()
-        await ada_api.end_conversation(conversation_id)
+        _enqueue(lambda: ada_api.end_conversation(conversation_id))
 
     async def _reset():
         app.storage.user.clear()
         ui.navigate.reload()
 
+    outbox: deque[Callable[[], Awaitable[None]]] = deque()
+    sender: asyncio.Task | None = None
+
     user_id = app.storage.user.get("end_user_id")
     display_name = app.storage.user.get("display_name", _generate_name())
-    avatar = "https://upload.wikimedia.org/wikipedia/commons/0/09/.hecko_-_Floaty_-_profile_picture.svg"
+    avatar = _DEFAULT_AVATAR
 
     user_id, conversation_id = await ada_api.start_new_conversation(user_id)
 
     app.storage.user["end_user_id"] = user_id
     app.storage.user["display_name"] = display_name
-    ui.query('.nicegui-content').classes("h-screen flex flex-col w-full")
 
-    chat_ui = ChatUI(user_id, conversation_id)
-    chat_ui.notifier_element()
+    chat_ui = ChatUI(frozenset({user_id}), conversation_id)
     chat_ui.message_list_element()
 
     with chat_ui.chat_footer():